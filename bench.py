@@ -0,0 +1,177 @@
+"""
+bench.py - throughput benchmark for creolize.Creolize.convert().
+
+    python -m bench [--sizes 10k,1m,50m] [--repeat 3] [--engine table]
+                    [--json bench.json]
+
+The corpus is made of the input sections of the specifications in
+tests/, plus generated pages rich in lists, tables, links and prose.
+"""
+
+import sys
+import re
+import time
+import json
+import argparse
+import creolize
+from tests import test_10_creole
+from tests import test_11_burnett
+from tests import test_12_listadditions
+from tests import test_13_larsch
+from tests import test_20_heading
+from tests import test_21_pholder
+from tests import test_22_plugin
+from tests import test_23_toc
+from tests import test_30_django
+
+SPECS = [
+    test_10_creole.SPEC, test_11_burnett.SPEC, test_12_listadditions.SPEC,
+    test_13_larsch.SPEC, test_20_heading.SPEC, test_21_pholder.SPEC,
+    test_22_plugin.SPEC, test_23_toc.SPEC, test_30_django.SPEC,
+]
+
+SIZES = {'k': 1024, 'm': 1024 * 1024}
+
+PAGE_PARTS = [
+    '== Section %(n)d\n\n',
+    'Plain prose with **bold**, //italic// and a [[WikiPage%(n)d|link]] '
+    'to another page, continued\non the next line with '
+    'http://example.com/page/%(n)d and more words.\n\n',
+    '* first item with [[Item%(n)d]]\n* second item\n'
+    '** nested item with //emphasis//\n# numbered\n## numbered child\n\n',
+    '|= name |= value |\n| alpha | %(n)d |\n| beta | [[Beta%(n)d]] |\n\n',
+    'A longer paragraph of ordinary prose, the kind that makes up most of '
+    'a wiki page, with an {{image%(n)d.png|image}} and a ~[[escaped]] '
+    'link, ending here.\n\n',
+    '{{{\nverbatim %(n)d\n  indented\n}}}\n\n',
+]
+
+
+def corpus():
+    """ collect the input sections of the test specifications. """
+    re_block = re.compile(r'''
+        ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+    ''', re.M|re.S|re.X)
+    re_part = re.compile(r'''
+        ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+    ''', re.M|re.S|re.X)
+    inputs = []
+    for spec in SPECS:
+        for m_block in re_block.finditer(spec):
+            for m_part in re_part.finditer(m_block.group(2)):
+                if m_part.group(1).rstrip(' ') == 'input':
+                    inputs.append(m_part.group(2).rstrip('\r\n '))
+    return inputs
+
+
+def synthetic_page(size):
+    """ generate a page of at least size characters. """
+    parts = []
+    length = 0
+    n = 0
+    while length < size:
+        part = PAGE_PARTS[n % len(PAGE_PARTS)] % {'n': n}
+        parts.append(part)
+        length += len(part)
+        n += 1
+    return ''.join(parts)
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1:] in SIZES:
+        return int(text[:-1]) * SIZES[text[-1]]
+    return int(text)
+
+
+def count_tokens(sources):
+    count = 0
+    for source in sources:
+        source = re.sub(r"(?:\r\n?|\n)", "\n", source)
+        source = source.rstrip("\n") + "\n"
+        for m in creolize.TOKEN_PATTERN.finditer(source):
+            count += 1
+    return count
+
+
+def measure(name, sources, repeat, engine):
+    """ convert the sources repeat times and keep the fastest run. """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for source in sources:
+            creo = creolize.Creolize()
+            creo.engine = engine
+            creo.convert(source)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    size = sum(len(source) for source in sources)
+    tokens = count_tokens(sources)
+    best = max(best, 1e-9)
+    return {
+        'name': name,
+        'pages': len(sources),
+        'bytes': size,
+        'tokens': tokens,
+        'seconds': best,
+        'mb_per_s': size / best / 1e6,
+        'tokens_per_s': tokens / best,
+    }
+
+
+def call_overhead(count, engine):
+    """ microseconds per convert() of an empty page. """
+    start = time.time()
+    for i in range(count):
+        creo = creolize.Creolize()
+        creo.engine = engine
+        creo.convert('')
+    return (time.time() - start) / count * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench',
+        description='measure the conversion speed of creolize')
+    parser.add_argument('--sizes', default='10k,1m,50m',
+        help='comma separated sizes of generated pages (default 10k,1m,50m)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='runs per measurement, the fastest is reported (default 3)')
+    parser.add_argument('--engine', default='table',
+        choices=['table', 'compiled'], help='Creolize.engine to measure')
+    parser.add_argument('--json', metavar='FILE',
+        help='write the results as JSON into FILE')
+    args = parser.parse_args(argv)
+
+    results = [measure('corpus', corpus(), args.repeat, args.engine)]
+    for size in args.sizes.split(','):
+        if size.strip():
+            page = synthetic_page(parse_size(size))
+            results.append(measure('page-' + size.strip(), [page],
+                args.repeat, args.engine))
+    overhead = call_overhead(1000, args.engine)
+
+    for r in results:
+        print('%-12s %10d bytes %10d tokens %8.3f s %8.3f MB/s %12.0f tokens/s'
+            % (r['name'], r['bytes'], r['tokens'], r['seconds'],
+               r['mb_per_s'], r['tokens_per_s']))
+    print('%-12s %10.1f us per convert() call' % ('overhead', overhead))
+
+    if args.json:
+        report = {
+            'python': sys.version.split()[0],
+            'engine': args.engine,
+            'repeat': args.repeat,
+            'results': results,
+            'call_overhead_us': overhead,
+        }
+        f = open(args.json, 'w')
+        try:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        finally:
+            f.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
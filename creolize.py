@@ -4,6 +4,26 @@ creolize.py - converter from WikiCreole 1.0 format to XHTML.
 """
 
 import re
+import os
+import io
+import sys
+import zlib
+import time
+import timeit
+import argparse
+import threading
+import collections
+import multiprocessing
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
 
 MARKUP = {
     '=': {'stag': '<h1>', 'etag': '</h1>\n'},
@@ -60,15 +80,40 @@ MARKUP = {
     'toc': {'stag': '<div class="toc">\n', 'etag': '</div>\n'},
 }
 
+# MARKUP for type 'text': blocks end with a newline, tabs separate table cells
+TEXT_MARKUP = {
+    '=': {'stag': '', 'etag': '\n'},
+    '==': {'stag': '', 'etag': '\n'},
+    '===': {'stag': '', 'etag': '\n'},
+    '====': {'stag': '', 'etag': '\n'},
+    '=====': {'stag': '', 'etag': '\n'},
+    '======': {'stag': '', 'etag': '\n'},
+    'p': {'stag': '', 'etag': '\n'},
+    'verbatim': {'stag': '', 'etag': '\n'},
+    '----': {'tag': ''},
+    '*': {'stag': '', 'etag': '\n', '*': '\n', '#': '\n', ';': '\n', ':': '\n'},
+    '#': {'stag': '', 'etag': '\n', '#': '\n', '*': '\n', ';': '\n', ':': '\n'},
+    ';': {'stag': '', 'etag': '\n', ';': '\n', ':': '\n', '*': '\n', '#': '\n'},
+    ':': {'stag': '', 'etag': '\n', ';': '\n', ':': '\n', '*': '\n', '#': '\n'},
+    '||': {'stag': '', 'etag': '\n', '||': '\n'},
+    '|': {'stag': '', 'etag': ''},
+    '|=': {'stag': '', 'etag': ''},
+    '>': {'stag': '', 'etag': ''},
+    '**': {'stag': '', 'etag': ''},
+    '//': {'stag': '', 'etag': ''},
+    '##': {'stag': '', 'etag': ''},
+    '^^': {'stag': '', 'etag': ''},
+    ',,': {'stag': '', 'etag': ''},
+    '__': {'stag': '', 'etag': ''},
+    '\\\\': {'tag': '\n'},
+    'nowiki': {'stag': '', 'etag': ''},
+    '<<<': {'stag': '', 'etag': ''},
+    'toc': {'stag': '', 'etag': ''},
+}
+
 # &<>"' : specials for XML/HTML
 # {} : specials for python Django Template
 # \ : special for javascript
-XML_SPECIAL_PATTERN = re.compile(r'''
-    (?:([<>"'\\\{\}])
-    | \& (?:([a-zA-Z_][a-zA-Z0-9_]*|\#(?:[0-9]{1,5}|x[0-9a-fA-F]{2,4}));)?
-    )
-''', re.M|re.S|re.X)
-
 XML_STOICK_PATTERN = re.compile(r'''([&<>"'\\\{\}])''', re.M|re.S|re.X)
 
 DJANGO_SPECIAL_PATTERN = re.compile(r'''
@@ -83,6 +128,31 @@ XML_SPECIAL = {
     '{': '&#123;', '}': '&#125;',
 }
 
+# XML_SPECIAL except '&' in replacement order, for str.replace
+XML_SPECIAL_REPLACE = (
+    ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#39;'),
+    ('\\', '&#92;'), ('{', '&#123;'), ('}', '&#125;'),
+)
+
+# '&' not beginning an entity reference
+XML_AMP_PATTERN = re.compile(r'''
+    \&(?!(?:[a-zA-Z_][a-zA-Z0-9_]*|\#(?:[0-9]{1,5}|x[0-9a-fA-F]{2,4}));)
+''', re.M|re.S|re.X)
+
+BRACKETED_PATTERN = re.compile(r'''
+    \[\[ [\x20\t]*
+    ([^\|]*?) [\x20\t]*
+    (?: \| [\x20\t]* (.*?) [\x20\t]* )?
+    \]\]\Z
+''', re.M|re.S|re.X)
+
+BRACED_PATTERN = re.compile(r'''
+    \{\{ [\x20\t]*
+    ([^\|]*?) [\x20\t]*
+    (?: \| [\x20\t]* (.*?) [\x20\t]* )?
+    \}\}\Z
+''', re.M|re.S|re.X)
+
 URI_SPECIAL_PATTERN = re.compile(r'''
     (?: (\%([0-9A-Fa-f]{2})?)
     |   (&(?:amp;)?)
@@ -271,9 +341,239 @@ TOKEN_STATE = {
     ],
 }
 
-class Creolize:
+# TOKEN_TRANSITION[m.lastindex * STATE_COUNT + state] is a pair of
+# the next state and the tuple of actions, built from TOKEN_STATE.
+STATE_COUNT = len(TOKEN_STATE['EOL'])
+TOKEN_EOF = TOKEN_PATTERN.groupindex['EOF']
+TOKEN_PLUGIN = TOKEN_PATTERN.groupindex['PLUGIN']
+TOKEN_TRANSITION = [None] * ((TOKEN_PATTERN.groups + 1) * STATE_COUNT)
+for (token_kind, token_index) in TOKEN_PATTERN.groupindex.items():
+    for (state, succ) in enumerate(TOKEN_STATE[token_kind]):
+        TOKEN_TRANSITION[token_index * STATE_COUNT + state] = (
+            succ[0], tuple(succ[1:]))
+del token_kind, token_index, state, succ
+
+# Creolize methods in the order of the action numbers in TOKEN_STATE.
+ACTIONS = (
+    '_end_heading',
+    '_end_indent',
+    '_end_list',
+    '_end_paragraph',
+    '_end_table',
+    '_insert_br',
+    '_insert_braced',
+    '_insert_bracketed',
+    '_insert_colon',
+    '_insert_escaped',
+    '_insert_freestand',
+    '_insert_hr',
+    '_insert_indent',
+    '_insert_list',
+    '_insert_nowiki',
+    '_insert_phrase',
+    '_insert_placeholder',
+    '_insert_plugin',
+    '_insert_td',
+    '_insert_tr',
+    '_insert_verbatim',
+    '_start_heading',
+    '_start_indent',
+    '_start_list',
+    '_start_paragraph',
+    '_start_table',
+    'put',
+    'puts',
+)
+ACTION_BRACED = ACTIONS.index('_insert_braced')
+ACTION_BRACKETED = ACTIONS.index('_insert_bracketed')
+ACTION_FREESTAND = ACTIONS.index('_insert_freestand')
+ACTION_PLUGIN = ACTIONS.index('_insert_plugin')
+
+# the state inside a heading line
+STATE_HEADING = TOKEN_STATE['HEADING'][0][0]
+
+# the tokens that may run over a blank line in a stream of lines
+BLOCK_TAG_PAIRS = (('{{{', '}}}'), ('<<', '>>'), ('<<<', '>>>'))
+BLOCK_TAGS = ('{{{', '}}}', '<<', '>>', '<<<', '>>>')
+
+# straight-line functions for the transitions, generated at first use
+COMPILED_TRANSITION = [None] * len(TOKEN_TRANSITION)
+
+# class -> list of the functions named in ACTIONS
+DISPATCH_TABLES = {}
+
+# methods outside the dispatch table measured by the profiler
+PROFILED_METHODS = (
+    '_insert_link', 'visit_link', 'visit_image', 'visit_plugin',
+    'escape_text', 'escape_xml', 'escape_uri', 'escape_name', 'escape_django',
+)
+
+class LRUCache(object):
+    """ a mapping holding at most maxsize entries, dropping the least
+        recently used one first, and counting hits and misses.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+class PluginCache(object):
+    """ a plugin visitor caching the results of another one.
+
+    A result is cached only when the plugin declares it: 'pure' true keeps
+    it until it is evicted, 'ttl' keeps it for that many seconds of clock.
+    Results are keyed on the plugin text and the configuration of the
+    builder. Awaitable results of convert_async() are never cached.
+    """
+
+    def __init__(self, visitor, maxsize=1024, clock=time.time):
+        self.visitor = visitor
+        self.clock = clock
+        self.cache = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def visit_plugin(self, data, builder):
+        key = (data, builder._fingerprint())
+        entry = self.cache.get(key)
+        if entry is not None and (entry[0] is None or entry[0] > self.clock()):
+            with self.lock:
+                self.hits += 1
+            return entry[1]
+        with self.lock:
+            self.misses += 1
+        plugin = self.visitor.visit_plugin(data, builder)
+        if isinstance(plugin, dict):
+            if plugin.get('pure'):
+                self.cache.put(key, (None, plugin))
+            elif plugin.get('ttl'):
+                self.cache.put(key, (self.clock() + plugin['ttl'], plugin))
+        return plugin
+
+class PreviewState(object):
+    """ a page rendered by Creolize.rerender(), split into top level blocks.
+
+    blocks holds (start, end, xhtml, tocinfo) for each block of the source
+    text. changed is the range of blocks rendered by the last call, which
+    replace the range replaced of the blocks of the previous state.
+    """
+
+    def __init__(self, text, fingerprint):
+        self.text = text
+        self.fingerprint = fingerprint
+        self.blocks = []
+        self.changed = (0, 0)
+        self.replaced = (0, 0)
+        self.result = ''
+        self.tocinfo = []
+
+def common_prefix_length(a, b, step=4096):
+    """ the length of the longest common prefix of strings a and b. """
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i:i + step] == b[i:i + step]:
+        i += step
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def common_suffix_length(a, b, limit, step=4096):
+    """ the length of the longest common suffix of a and b up to limit. """
+    i = 0
+    while i < limit:
+        j = min(i + step, limit)
+        if a[len(a) - j:len(a) - i] != b[len(b) - j:len(b) - i]:
+            break
+        i = j
+    while i < limit and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+    return i
+
+class Profile(object):
+    """ call counts and inclusive wall time of the actions, of some helper
+        methods and of the token kinds, gathered when Creolize.profile is set.
+    """
 
     def __init__(self):
+        self.calls = {}
+        self.seconds = {}
+        self.token_calls = {}
+        self.token_seconds = {}
+
+    def wrap(self, name, method):
+        calls = self.calls
+        seconds = self.seconds
+        calls[name] = 0
+        seconds[name] = 0.0
+        timer = timeit.default_timer
+        def profiled(*args):
+            start = timer()
+            try:
+                return method(*args)
+            finally:
+                seconds[name] += timer() - start
+                calls[name] += 1
+        return profiled
+
+    def add_token(self, token_kind, elapsed):
+        self.token_calls[token_kind] = self.token_calls.get(token_kind, 0) + 1
+        self.token_seconds[token_kind] = (
+            self.token_seconds.get(token_kind, 0.0) + elapsed)
+
+    def __str__(self):
+        lines = []
+        for (title, calls, seconds) in [
+            ('action', self.calls, self.seconds),
+            ('token', self.token_calls, self.token_seconds)
+        ]:
+            lines.append('%-20s %10s %12s' % (title, 'calls', 'seconds'))
+            names = sorted(calls, key=lambda name: -seconds[name])
+            for name in names:
+                if calls[name]:
+                    lines.append('%-20s %10d %12.6f'
+                        % (name, calls[name], seconds[name]))
+        return '\n'.join(lines) + '\n'
+
+class Creolize(object):
+    """ WikiCreole to XHTML converter.
+
+    An instance holds only the configuration and may be shared by threads.
+    Each conversion runs on a shallow copy made by _builder(), which carries
+    the state of that render and is returned by convert().
+    """
+
+    def __init__(self, **config):
         self.type = 'xhtml'
         self.script_name = 'http://example.net/wiki/'
         self.static_location = 'http://example.net/static/'
@@ -281,47 +581,169 @@ class Creolize:
         self.plugin_visitor = None
         self.plugin_running = False
         self.toc = 0
+        self.toc_position = 'top'
         self.tocinfo = []
-        self.dispatch_table = [
-            self._end_heading,
-            self._end_indent,
-            self._end_list,
-            self._end_paragraph,
-            self._end_table,
-            self._insert_br,
-            self._insert_braced,
-            self._insert_bracketed,
-            self._insert_colon,
-            self._insert_escaped,
-            self._insert_freestand,
-            self._insert_hr,
-            self._insert_indent,
-            self._insert_list,
-            self._insert_nowiki,
-            self._insert_phrase,
-            self._insert_placeholder,
-            self._insert_plugin,
-            self._insert_td,
-            self._insert_tr,
-            self._insert_verbatim,
-            self._start_heading,
-            self._start_indent,
-            self._start_list,
-            self._start_paragraph,
-            self._start_table,
-            self.put,
-            self.puts,
-        ]
+        self.heading_id = 'crc32'
+        self.write_buffer_size = 8192
+        self.engine = 'table'
+        self.profile = False
+        self.profile_report = None
+        self.cache = None
+        self.escape_cache = None
+        for (name, value) in config.items():
+            if name not in self.__dict__:
+                raise TypeError('unknown configuration: %s' % name)
+            setattr(self, name, value)
+
+    def _builder(self):
+        """ a copy of self with the state of a new render. """
+        builder = object.__new__(self.__class__)
+        builder.__dict__.update(self.__dict__)
+        builder.tocinfo = []
+        builder._init_generator()
+        return builder
+
+    def _dispatch_table(self):
+        cls = self.__class__
+        table = DISPATCH_TABLES.get(cls)
+        if table is None:
+            table = []
+            for name in ACTIONS:
+                method = getattr(cls, name)
+                table.append(getattr(method, '__func__', method))
+            DISPATCH_TABLES[cls] = table
+        return table
 
     def convert(self, wiki_source):
-        self._init_generator()
-        for (data, action_list) in self.scaniter(wiki_source):
-            for i in action_list:
-                self.dispatch_table[i](data)
-        if self.toc and len(self.tocinfo) >= self.toc:
-            toc = self._list_toc().result
-            self.result = toc + self.result
-        return self
+        """ convert wiki_source, returning the builder holding result. """
+        builder = self._builder()
+        builder._convert(builder._source_blocks(wiki_source))
+        return builder
+
+    def _convert(self, pieces):
+        if self.toc and self.toc_position == 'top':
+            self.output.append('')
+        for _ in self._render(pieces):
+            pass
+        self._finish_toc(self.toc_position)
+        self.result = ''.join(self.output)
+
+    def _finish_toc(self, position):
+        """ render the table of contents into toc_result and put it into
+            the slot reserved at the top of output, at the end of output,
+            or nowhere for 'separate'.
+        """
+        if position not in ('top', 'end', 'separate'):
+            raise ValueError('unknown toc_position: %r' % (position,))
+        if not self.toc or len(self.tocinfo) < self.toc:
+            return
+        self.toc_result = self._list_toc()
+        if position == 'top':
+            self.output[0] = self.toc_result
+        elif position == 'end':
+            self.output.append(self.toc_result)
+
+    def convert_async(self, wiki_source):
+        """ convert with a plugin visitor whose visit_plugin may return
+            awaitables, returning an asyncio future of the builder.
+
+        The plugins of the page are called in source order, their awaitables
+        run concurrently, and the page is rendered once all are done, as
+        convert() would render it with those results. The plugins are called
+        before rendering, so the builder they see has the tocinfo and output
+        of the start of the page, not those at their place as in convert().
+        Call it with a running event loop.
+        """
+        if asyncio is None:
+            raise RuntimeError('convert_async needs asyncio')
+        builder = self._builder()
+        pieces = list(builder._source_blocks(wiki_source))
+        calls = []
+        running = builder.plugin_running
+        if not running:
+            visitor = builder.plugin_visitor or builder
+            builder.plugin_running = True
+            try:
+                for (data, actions, state) in builder._transitions(pieces):
+                    if ACTION_PLUGIN in actions:
+                        plugin = visitor.visit_plugin(data, builder)
+                        calls.append(_as_future(plugin))
+            except:
+                builder.plugin_running = running
+                for call in calls:
+                    call.cancel()
+                raise
+        gathered = asyncio.gather(*calls)
+        future = asyncio.Future()
+
+        def finish(gathered):
+            builder.plugin_running = running
+            if gathered.cancelled():
+                future.cancel()
+                return
+            if gathered.exception() is not None:
+                future.set_exception(gathered.exception())
+                return
+            if not running:
+                builder.plugin_results = collections.deque(gathered.result())
+            try:
+                builder._convert(pieces)
+            except Exception as e:
+                future.set_exception(e)
+                return
+            future.set_result(builder)
+
+        gathered.add_done_callback(finish)
+        return future
+
+    def convert_iter(self, wiki_source):
+        """ yield the XHTML of each top level block as soon as it closes.
+
+        The table of contents cannot precede the headings in a stream. It
+        is yielded last when toc_position is 'end', otherwise it is only
+        kept in toc_result of the builder.
+        """
+        return self._builder()._convert_iter(wiki_source)
+
+    def _convert_iter(self, wiki_source):
+        for _ in self._render(self._source_blocks(wiki_source)):
+            if self.output:
+                yield ''.join(self.output)
+                self.output = []
+        if self.output:
+            yield ''.join(self.output)
+            self.output = []
+        self._finish_toc('end' if self.toc_position == 'end' else 'separate')
+        if self.output:
+            yield ''.join(self.output)
+            self.output = []
+
+    def convert_to(self, wiki_source, stream, encoding=None):
+        """ write the XHTML into a file-like object having write().
+
+        Blocks are buffered up to write_buffer_size characters and written
+        out only at block boundaries. Returns the builder holding tocinfo
+        and toc_result, placed as in convert_iter().
+        """
+        builder = self._builder()
+        pending = []
+        size = 0
+        for chunk in builder._convert_iter(wiki_source):
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= self.write_buffer_size:
+                self._write_chunks(stream, pending, encoding)
+                pending = []
+                size = 0
+        if pending:
+            self._write_chunks(stream, pending, encoding)
+        return builder
+
+    def _write_chunks(self, stream, chunks, encoding):
+        data = ''.join(chunks)
+        if encoding is not None:
+            data = data.encode(encoding)
+        stream.write(data)
 
     def visit_link(self, link, text, builder):
         anchor = {}
@@ -351,61 +773,476 @@ class Creolize:
             plugin['djangotag'] = 'wiki_plugin ' + data
         return plugin
 
-    def scaniter(self, wiki_source):
-        wiki_source = re.sub(r"(?:\r\n?|\n)", "\n", wiki_source)
-        wiki_source = wiki_source.rstrip("\n") + "\n"
+    def _render(self, pieces):
+        """ run the actions of the tokens in the (text, final) pieces and
+            yield whenever the grammar comes back to the top level.
+        """
+        visitor = self.link_visitor or self
+        if self.type != 'text' and (hasattr(visitor, 'visit_links')
+                or hasattr(visitor, 'visit_images')):
+            pieces = self._prefetch_links(pieces, visitor)
+        if self.profile:
+            return self._render_profiled(pieces)
+        if self.cache is not None:
+            return self._render_cached(pieces)
+        return self._render_engine(pieces)
+
+    def _prefetch_links(self, pieces, visitor):
+        """ pass the pieces through, giving the links and images of each
+            one to the visit_links and visit_images methods of visitor.
+
+        Each takes a list of distinct (link, text) or (link, title) pairs
+        and the builder, and returns the anchors or images in that order.
+        Links missing from the answers are sent to visit_link as before.
+        """
+        for (text, final) in pieces:
+            links = []
+            images = []
+            for (link, desc, kind, pos) in self._scan_links(text, final):
+                if kind == 'braced':
+                    images.append((link, desc))
+                else:
+                    links.append((link, desc))
+            if links and hasattr(visitor, 'visit_links'):
+                links = list(collections.OrderedDict.fromkeys(links))
+                anchors = visitor.visit_links(links, self)
+                self.link_anchors.update(zip(links, anchors))
+            if images and hasattr(visitor, 'visit_images'):
+                images = list(collections.OrderedDict.fromkeys(images))
+                found = visitor.visit_images(images, self)
+                self.image_attrs.update(zip(images, found))
+            yield (text, final)
+
+    def links(self, wiki_source):
+        """ a list of (target, description, kind, offset) for the links and
+            images of wiki_source, in source order.
+
+        kind is the token kind, 'bracketed', 'freestand' or 'braced', and
+        offset is that of the token in the source with its newlines
+        normalized to LF. No XHTML is built and no visitor is called.
+        """
+        result = []
+        offset = 0
+        for (text, final) in self._source_blocks(wiki_source):
+            result.extend(self._scan_links(text, final, offset))
+            offset += len(text)
+        return result
+
+    def _scan_links(self, text, final, offset=0):
+        """ yield (target, description, kind, offset) for the tokens of text
+            running a link or image action, as convert() would find them.
+        """
         state = 0
-        for m in TOKEN_PATTERN.finditer(wiki_source):
+        for m in TOKEN_PATTERN.finditer(text):
             if state is None:
                 break
-            token_kind = m.lastgroup
-            data = m.groupdict()[m.lastgroup]
-            succ = TOKEN_STATE[token_kind][state]
-            actions = succ[1:]
-            if len(actions) > 0:
-                yield (data, actions)
-            state = succ[0]
+            i = m.lastindex
+            if i == TOKEN_EOF and not final:
+                break
+            (state, actions) = TOKEN_TRANSITION[i * STATE_COUNT + state]
+            for k in actions:
+                if k == ACTION_FREESTAND:
+                    yield (m.group(i), m.group(i), 'freestand',
+                        offset + m.start(i))
+                elif k == ACTION_BRACKETED:
+                    link = BRACKETED_PATTERN.match(m.group(i))
+                    if link:
+                        (url, desc) = link.groups()
+                        yield (url, url if desc is None else desc,
+                            'bracketed', offset + m.start(i))
+                elif k == ACTION_BRACED:
+                    image = BRACED_PATTERN.match(m.group(i))
+                    if image:
+                        (url, title) = image.groups()
+                        yield (url, title or '', 'braced', offset + m.start(i))
+
+    def _render_engine(self, pieces):
+        if self.engine == 'table':
+            dispatch_table = self._dispatch_table()
+            for (data, action_list, state) in self._transitions(pieces):
+                for i in action_list:
+                    dispatch_table[i](self, data)
+                if state == 0:
+                    yield
+        elif self.engine == 'compiled':
+            compiled = COMPILED_TRANSITION
+            state = 0
+            for (text, final) in pieces:
+                for m in TOKEN_PATTERN.finditer(text):
+                    if state is None:
+                        break
+                    i = m.lastindex
+                    if i == TOKEN_EOF and not final:
+                        break
+                    k = i * STATE_COUNT + state
+                    step = compiled[k] or self._compile_transition(k)
+                    state = step(self, m.group(i))
+                    if state == 0:
+                        yield
+        else:
+            raise ValueError('unknown engine: %r' % (self.engine,))
+
+    def _render_cached(self, pieces):
+        """ _render reusing the output of top level blocks found in cache.
+
+        Blocks calling plugins are always rendered and never stored.
+        """
+        fingerprint = self._fingerprint()
+        for (text, final) in pieces:
+            for (start, end, last, cacheable) in self._block_spans(text, final):
+                block = text[start:end]
+                key = (fingerprint, block)
+                entry = self.cache.get(key) if cacheable else None
+                if entry is None:
+                    entry = self._render_block(block, last)
+                    if cacheable:
+                        self.cache.put(key, entry)
+                else:
+                    self.output.append(entry[0])
+                    self.tocinfo.extend(list(info) for info in entry[1])
+                yield
+
+    def _render_block(self, block, final):
+        """ render a top level block, returning its XHTML and tocinfo. """
+        output_pos = len(self.output)
+        tocinfo_pos = len(self.tocinfo)
+        for _ in self._render_engine([(block, final)]):
+            pass
+        return (''.join(self.output[output_pos:]),
+            [list(info) for info in self.tocinfo[tocinfo_pos:]])
+
+    def _block_spans(self, text, final, pos=0):
+        """ yield (start, end, final, cacheable) for the top level blocks of
+            text from pos, each one ending where the grammar comes back to
+            state 0 after running actions.
+        """
+        state = 0
+        start = pos
+        cacheable = True
+        for m in TOKEN_PATTERN.finditer(text, pos):
+            i = m.lastindex
+            if i == TOKEN_EOF:
+                break
+            (state, actions) = TOKEN_TRANSITION[i * STATE_COUNT + state]
+            if i == TOKEN_PLUGIN:
+                cacheable = False
+            if actions and state == 0:
+                yield (start, m.end(), False, cacheable)
+                start = m.end()
+                cacheable = True
+        if start < len(text) or final:
+            yield (start, len(text), final, cacheable)
+
+    def rerender(self, prev_state, new_source):
+        """ render new_source for a live preview, returning a PreviewState.
+
+        The blocks of prev_state, a PreviewState from the previous call or
+        None, are kept up to the first one the edit may affect. Scanning
+        resumes there and stops at the first block boundary after the edit
+        that was also a boundary before it; the rest is kept as well.
+        """
+        return self._builder()._rerender(prev_state, new_source)
+
+    def _rerender(self, prev_state, new_source):
+        text = next(self._source_blocks(new_source))[0]
+        state = PreviewState(text, self._fingerprint())
+        old_blocks = []
+        if prev_state is not None and prev_state.fingerprint == state.fingerprint:
+            old_blocks = prev_state.blocks
+            if prev_state.text == text:
+                n = len(old_blocks)
+                return self._finish_preview(state, old_blocks, (n, n), (n, n))
+            blocks = self._rescan_blocks(prev_state.text, old_blocks, text)
+            return self._finish_preview(state, *blocks)
+        blocks = []
+        for (start, end, last, cacheable) in self._block_spans(text, True):
+            (html, tocinfo) = self._render_block(text[start:end], last)
+            blocks.append((start, end, html, tocinfo))
+        return self._finish_preview(state, blocks, (0, len(blocks)), (0, 0))
+
+    def _rescan_blocks(self, old_text, old_blocks, text):
+        """ the blocks of text, the range of them rendered again and
+            the range of old_blocks they replace.
+        """
+        prefix = common_prefix_length(old_text, text)
+        k = 0
+        while k < len(old_blocks) - 1 and old_blocks[k][1] < prefix:
+            k += 1
+        if k > 0 and not self._is_closed(old_text[:old_blocks[k - 1][1]]):
+            k = 0
+        limit = min(len(old_text), len(text)) - prefix
+        edit_end = len(old_text) - common_suffix_length(old_text, text, limit)
+        delta = len(text) - len(old_text)
+        resync = {}
+        for j in range(k, len(old_blocks)):
+            if old_blocks[j][0] >= edit_end:
+                resync[old_blocks[j][0] + delta] = j
+        blocks = old_blocks[:k]
+        pos = blocks[-1][1] if blocks else 0
+        j = len(old_blocks)
+        tail = []
+        for (start, end, last, cacheable) in self._block_spans(text, True, pos):
+            if start in resync:
+                j = resync[start]
+                tail = [(b[0] + delta, b[1] + delta, b[2], b[3])
+                    for b in old_blocks[j:]]
+                break
+            (html, tocinfo) = self._render_block(text[start:end], last)
+            blocks.append((start, end, html, tocinfo))
+        changed = (k, len(blocks))
+        return (blocks + tail, changed, (k, j))
+
+    def _finish_preview(self, state, blocks, changed, replaced):
+        state.blocks = blocks
+        state.changed = changed
+        state.replaced = replaced
+        self.output = []
+        if self.toc and self.toc_position == 'top':
+            self.output.append('')
+        self.output.extend(block[2] for block in blocks)
+        self.tocinfo = []
+        for block in blocks:
+            self.tocinfo.extend(list(info) for info in block[3])
+        self._finish_toc(self.toc_position)
+        state.result = self.result = ''.join(self.output)
+        state.tocinfo = self.tocinfo
+        return state
+
+    def _fingerprint(self):
+        """ the configuration affecting the output of a block. """
+        return (self.__class__, self.type, self.script_name,
+            self.static_location, bool(self.toc), self.heading_id,
+            self.link_visitor, self.plugin_visitor)
+
+    def _render_profiled(self, pieces):
+        """ _render with an instrumented dispatch table, leaving the Profile
+            in profile_report.
+        """
+        profile = self.profile_report = Profile()
+        dispatch_table = [profile.wrap(name, getattr(self, name))
+            for name in ACTIONS]
+        saved = dict((name, self.__dict__[name])
+            for name in PROFILED_METHODS if name in self.__dict__)
+        for name in PROFILED_METHODS:
+            setattr(self, name, profile.wrap(name, getattr(self, name)))
+        timer = timeit.default_timer
+        state = 0
+        try:
+            for (text, final) in pieces:
+                for m in TOKEN_PATTERN.finditer(text):
+                    if state is None:
+                        break
+                    i = m.lastindex
+                    if i == TOKEN_EOF and not final:
+                        break
+                    (state, actions) = TOKEN_TRANSITION[i * STATE_COUNT + state]
+                    data = m.group(i)
+                    start = timer()
+                    for k in actions:
+                        dispatch_table[k](data)
+                    profile.add_token(m.lastgroup, timer() - start)
+                    if actions and state == 0:
+                        yield
+        finally:
+            for name in PROFILED_METHODS:
+                del self.__dict__[name]
+            self.__dict__.update(saved)
+
+    def _compile_transition(self, k):
+        """ generate the function calling the actions of TOKEN_TRANSITION[k]
+            one after another and returning the next state.
+        """
+        (state, actions) = TOKEN_TRANSITION[k]
+        source = ['def transition(self, data):']
+        for i in actions:
+            source.append('    self.%s(data)' % ACTIONS[i])
+        source.append('    return %r' % (state,))
+        namespace = {}
+        code = compile('\n'.join(source) + '\n', '<transition %d>' % k, 'exec')
+        exec(code, namespace)
+        COMPILED_TRANSITION[k] = namespace['transition']
+        return COMPILED_TRANSITION[k]
+
+    def plaintext(self, wiki_source):
+        """ the visible text of wiki_source, as convert() with type 'text'.
+
+        The text is not escaped. Links give their descriptions and images
+        their titles without calling the link visitor. Blocks end with a
+        newline and tabs separate table cells. convert_iter() and
+        convert_to() with type 'text' stream the same text.
+        """
+        builder = self._builder()
+        builder.type = 'text'
+        builder._init_generator()
+        builder._convert(builder._source_blocks(wiki_source))
+        return builder.result
+
+    def outline(self, wiki_source):
+        """ a list of (level, id, text) for the headings of wiki_source.
+
+        Only the tokens of heading lines run their actions, with the
+        default link and plugin visitors; the rest of the page is only
+        scanned. The ids and texts are those of tocinfo when the visitors
+        keep the text of the links and plugins in headings.
+        """
+        builder = self._builder()
+        builder.toc = 1
+        builder.link_visitor = None
+        builder.plugin_visitor = None
+        dispatch_table = builder._dispatch_table()
+        state = 0
+        for (text, final) in builder._source_blocks(wiki_source):
+            for m in TOKEN_PATTERN.finditer(text):
+                if state is None:
+                    break
+                i = m.lastindex
+                if i == TOKEN_EOF and not final:
+                    break
+                inside = state == STATE_HEADING
+                (state, actions) = TOKEN_TRANSITION[i * STATE_COUNT + state]
+                if inside:
+                    for k in actions:
+                        dispatch_table[k](builder, m.group(i))
+                    if state != STATE_HEADING:
+                        builder.output = []
+                elif state == STATE_HEADING:
+                    builder._start_heading(m.group(i))
+        return [tuple(info) for info in builder.tocinfo]
+
+    def scaniter(self, wiki_source):
+        pieces = self._source_blocks(wiki_source)
+        for (data, actions, state) in self._transitions(pieces):
+            yield (data, actions)
+
+    def _transitions(self, pieces):
+        """ yield (data, actions, next_state) for tokens having actions. """
+        state = 0
+        transition = TOKEN_TRANSITION
+        for (text, final) in pieces:
+            for m in TOKEN_PATTERN.finditer(text):
+                if state is None:
+                    break
+                i = m.lastindex
+                if i == TOKEN_EOF and not final:
+                    break
+                (state, actions) = transition[i * STATE_COUNT + state]
+                if actions:
+                    yield (m.group(i), actions, state)
+
+    def _source_blocks(self, wiki_source):
+        """ yield (text, final) pieces of the newline normalized source.
+
+        A string is a single piece. A file object or an iterator of lines
+        is read lazily and cut after blank lines that no token crosses.
+        """
+        if isinstance(wiki_source, string_types):
+            wiki_source = re.sub(r"(?:\r\n?|\n)", "\n", wiki_source)
+            yield (wiki_source.rstrip("\n") + "\n", True)
+            return
+        # the block is scanned line by line as _is_closed() would scan it:
+        # last holds the offsets of the last tags in the block, verbatim
+        # the offset of its last '{{{' line and closed whether a '}}}' line
+        # follows it.
+        block = []
+        size = 0
+        last = {}
+        verbatim = None
+        closed = True
+        rest = ''
+        for data in wiki_source:
+            data = rest + data
+            rest = ''
+            if data.endswith('\r'):
+                data, rest = data[:-1], '\r'
+            data = re.sub(r"(?:\r\n?|\n)", "\n", data)
+            i = data.rfind('\n') + 1
+            if i < len(data):
+                data, rest = data[:i], data[i:] + rest
+            for line in re.findall(r'[^\n]*\n', data):
+                block.append(line)
+                for tag in BLOCK_TAGS:
+                    j = line.rfind(tag)
+                    if j >= 0:
+                        last[tag] = size + j
+                if line == '{{{\n':
+                    verbatim = size
+                    closed = False
+                elif line == '}}}\n' and verbatim is not None \
+                        and size > verbatim + 4:
+                    closed = True
+                size += len(line)
+                if line.strip(' \t\n') == '' and closed and all(
+                        last.get(stag, -1) <= last.get(etag, -1)
+                        for (stag, etag) in BLOCK_TAG_PAIRS):
+                    yield (''.join(block), False)
+                    block = []
+                    size = 0
+                    last = {}
+                    verbatim = None
+        text = re.sub(r"(?:\r\n?|\n)", "\n", ''.join(block) + rest)
+        yield (text.rstrip("\n") + "\n", True)
+
+    def _is_closed(self, text):
+        """ tell whether no token starting in text may run beyond its end. """
+        for (stag, etag) in BLOCK_TAG_PAIRS:
+            if text.rfind(stag) > text.rfind(etag):
+                return False
+        i = text.rfind('\n{{{\n') + 1
+        if i > 0 or text.startswith('{{{\n'):
+            if text.find('\n}}}\n', i + 4) < 0:
+                return False
+        return True
 
     def _init_generator(self):
         self.prev_wtype = WTYPE_NULL
         self.blank = ''
-        self.result = ''
+        self.output = []
         self.list = []
+        self.link_anchors = {}
+        self.image_attrs = {}
+        self.plugin_results = None
+        self.toc_result = None
         self._clear_phrase()
+        if self.type == 'text':
+            self.markup = TEXT_MARKUP
+            self.escape_text = self.escape_xml = plain_text
+            self.toc = 0
+        else:
+            self.markup = MARKUP
 
     def _start_block(self, mark):
-        self.result += self.blank + MARKUP[mark]['stag']
+        self.output.append(self.blank + self.markup[mark]['stag'])
         self.blank = ''
         self.prev_wtype = WTYPE_STAG
         self._clear_phrase()
 
     def _end_block(self, mark):
         self._flush_phrase()
-        self.result += MARKUP[mark]['etag']
+        self.output.append(self.markup[mark]['etag'])
         self.blank = ''
         self.prev_wtype = WTYPE_ETAG
 
     def _put_markup(self, mark, kind):
         if kind != 'stag':
             self.blank = ''
-        self.result += self.blank + MARKUP[mark][kind]
+        self.output.append(self.blank + self.markup[mark][kind])
         self.blank = ''
         self.prev_wtype = WTYPE_ETAG if kind == 'etag' else WTYPE_STAG
 
     def put(self, data):
-        self.result += self.blank + self.escape_text(data)
+        self.output.append(self.blank + self.escape_text(data))
         self.blank = ''
         self.prev_wtype = WTYPE_TEXT
         return self
 
     def put_xml(self, data):
-        self.result += self.blank + self.escape_xml(data)
+        self.output.append(self.blank + self.escape_xml(data))
         self.blank = ''
         self.prev_wtype = WTYPE_TEXT
         return self
 
     def put_raw(self, data):
-        self.result += self.blank + data
+        self.output.append(self.blank + data)
         self.blank = ''
         self.prev_wtype = WTYPE_TEXT
         return self
@@ -413,31 +1250,56 @@ class Creolize:
     def puts(self, data):
         self.blank = ''
         if data == '':
-            self.result += '\n'
+            self.output.append('\n')
             self.prev_wtype = WTYPE_NULL
         elif self.prev_wtype == WTYPE_TEXT:
-            c = ord(self.result[-1])
-            if c >= 0x21 and c <= 0x7e:
+            c = self._last_char()
+            if c >= '\x21' and c <= '\x7e':
                 self.blank = ' '
         elif self.prev_wtype == WTYPE_ETAG:
             self.blank = ' '
         return self
 
+    def _last_char(self):
+        for chunk in reversed(self.output):
+            if chunk:
+                return chunk[-1]
+        return ''
+
     def escape_xml(self, s):
-        def repl(m):
-            return XML_SPECIAL[m.group(1)];
-        return XML_STOICK_PATTERN.sub(repl, s)
+        if not XML_STOICK_PATTERN.search(s):
+            return s
+        if '&' in s:
+            s = s.replace('&', '&amp;')
+        for (c, entity) in XML_SPECIAL_REPLACE:
+            if c in s:
+                s = s.replace(c, entity)
+        return s
 
     def escape_text(self, s):
-        def repl(m):
-            if m.group(1):
-                return XML_SPECIAL[m.group(1)]
-            elif m.group(2):
-                return '&' + m.group(2) + ';'
-            return '&amp;'
-        return XML_SPECIAL_PATTERN.sub(repl, s)
+        """ escape_xml except for '&' beginning an entity reference. """
+        if not XML_STOICK_PATTERN.search(s):
+            return s
+        for (c, entity) in XML_SPECIAL_REPLACE:
+            if c in s:
+                s = s.replace(c, entity)
+        if '&' in s:
+            s = XML_AMP_PATTERN.sub('&amp;', s)
+        return s
 
     def escape_uri(self, uri):
+        """ percent-encode uri, memoized in escape_cache if it is set. """
+        cache = self.escape_cache
+        if cache is None:
+            return self._escape_uri(uri)
+        key = ('uri', uri)
+        value = cache.get(key)
+        if value is None:
+            value = self._escape_uri(uri)
+            cache.put(key, value)
+        return value
+
+    def _escape_uri(self, uri):
         def repl(m):
             if m.group(2):
                 return m.group(1)
@@ -450,24 +1312,41 @@ class Creolize:
         return URI_SPECIAL_PATTERN.sub(repl, uri.encode('utf_8'))
 
     def escape_name(self, name):
+        """ percent-encode name, memoized in escape_cache if it is set. """
+        cache = self.escape_cache
+        if cache is None:
+            return self._escape_name(name)
+        key = ('name', name)
+        value = cache.get(key)
+        if value is None:
+            value = self._escape_name(name)
+            cache.put(key, value)
+        return value
+
+    def _escape_name(self, name):
         def repl(m):
             return ('%%%02X' % ord(m.group(1)))
         return NAME_SPECIAL_PATTERN.sub(repl, name.encode('utf_8'))
 
     def escape_django(self, s):
-        def repl(m):
-            if m.group(1):
-                return XML_SPECIAL[m.group(1)]
-            elif m.group(2):
-                return '&' + m.group(2) + ';'
-            return '&amp;'
-        return XML_SPECIAL_PATTERN.sub(repl, s)
+        return self.escape_text(s)
 
     def hash_base36(self, text):
-        x = hash(text.encode('utf_8'))
+        """ 7 base36 digits of a digest of text chosen by heading_id:
+            'crc32', or 'compat' for the string hash of 32 bit Python 2.
+        """
+        data = text
+        if not isinstance(data, bytes):
+            data = data.encode('utf_8')
+        if self.heading_id == 'crc32':
+            x = zlib.crc32(data) & 0xffffffff
+        elif self.heading_id == 'compat':
+            x = string_hash32(data)
+        else:
+            raise ValueError('unknown heading_id: %r' % (self.heading_id,))
         b36 = ''
         for e in [2176782336, 60466176, 1679616, 46656, 1296, 36, 1]:
-            b36 = b36 + BASE36[x / e]
+            b36 = b36 + BASE36[x // e]
             x = x % e
         return b36
 
@@ -481,7 +1360,9 @@ class Creolize:
 
     def _start_heading(self, data):
         self.heading = data[0:6]
-        self.heading_pos = len(self.result)
+        if self.toc:
+            self.heading_outer = self.output
+            self.output = []
         self._start_block(self.heading)
 
     def _end_heading(self, data):
@@ -491,29 +1372,43 @@ class Creolize:
         self.heading = None
         if not self.toc:
             return
-        i = self.result.find('<h', self.heading_pos) + 3
-        if i < 3:
-            return
-        text = self.result[self.heading_pos:].rstrip('\n')
-        text = re.sub(r'<.*?>', '', text)
-        if len(text) == 0:
-            return
-        hid = 'h' + self.hash_base36(text)
-        self.result = self.result[:i] + ' id="' + hid + '"' + self.result[i:]
-        self.tocinfo.append([len(mark), hid, text])
+        heading = self.output
+        self.output = self.heading_outer
+        self.heading_outer = None
+        text = re.sub(r'<.*?>', '', ''.join(heading).rstrip('\n'))
+        if text:
+            hid = 'h' + self.hash_base36(text)
+            i = heading[0].find('<h') + 3
+            heading[0] = heading[0][:i] + ' id="' + hid + '"' + heading[0][i:]
+            self.tocinfo.append([len(mark), hid, text])
+        self.output.extend(heading)
 
     def _list_toc(self):
-        toc = self.__class__()
-        toc._init_generator()
-        if not self.toc:
-            return toc
-        toc._put_markup('toc', 'stag')
-        for info in self.tocinfo:
-            toc._insert_list('*' * info[0])
-            toc._insert_link(info[2], '#' + info[1], info[2])
-        toc._end_list('')
-        toc._put_markup('toc', 'etag')
-        return toc
+        """ the XHTML of the table of contents, built into a fresh output
+            buffer with the default link visitor.
+        """
+        saved = (self.output, self.prev_wtype, self.blank, self.list,
+            self.phrase, self.phrase_stack, self.link_visitor,
+            self.link_anchors)
+        self.output = []
+        self.prev_wtype = WTYPE_NULL
+        self.blank = ''
+        self.list = []
+        self._clear_phrase()
+        self.link_visitor = None
+        self.link_anchors = {}
+        try:
+            self._put_markup('toc', 'stag')
+            for info in self.tocinfo:
+                self._insert_list('*' * info[0])
+                self._insert_link(info[2], '#' + info[1], info[2])
+            self._end_list('')
+            self._put_markup('toc', 'etag')
+            return ''.join(self.output)
+        finally:
+            (self.output, self.prev_wtype, self.blank, self.list,
+                self.phrase, self.phrase_stack, self.link_visitor,
+                self.link_anchors) = saved
 
     def _start_indent(self, data):
         """ ': indented paragraph', '> and also' """
@@ -552,8 +1447,7 @@ class Creolize:
             if self.list[-2][0] < level:
                 self.list[-1][0] = level
                 break
-            e = self.list.pop()
-            self._put_markup(e[1], 'etag')
+            self._pop_list()
         if len(self.list) == 0:
             self._put_markup(mark, 'stag')
             self.list.append([level, mark])
@@ -575,10 +1469,16 @@ class Creolize:
     def _end_list(self, data):
         self._flush_phrase()
         while len(self.list) > 0:
-            e = self.list.pop()
-            self._put_markup(e[1], 'etag')
+            self._pop_list()
         self.list = []
 
+    def _pop_list(self):
+        e = self.list.pop()
+        if self.list and self.type == 'text':
+            # the item of the outer list ends the line
+            return
+        self._put_markup(e[1], 'etag')
+
     def _start_table(self, data):
         """ '|table|data|\n' """
         self._put_markup('||', 'stag')
@@ -594,6 +1494,9 @@ class Creolize:
     def _insert_td(self, data):
         """ '| td |= th | """
         self._end_block(self.table)
+        if self.type == 'text':
+            # cells are separated, not ended, by tabs
+            self.output.append('\t')
         self.table = re.match(r'(\|=?)', data).group(1)
         self._start_block(self.table)
 
@@ -653,12 +1556,7 @@ class Creolize:
 
     def _insert_bracketed(self, data):
         """ links: '[[ url | description ]]' """
-        m = re.match(r'''(?msx)
-            \[\[ [\x20\t]*
-            ([^\|]*?) [\x20\t]*
-            (?: \| [\x20\t]* (.*?) [\x20\t]* )?
-            \]\]\Z
-        ''', data)
+        m = BRACKETED_PATTERN.match(data)
         if not m:
             self.put(data)
             return
@@ -669,22 +1567,22 @@ class Creolize:
 
     def _insert_braced(self, data):
         """  images: "{{ url | description }}" """
-        m = re.match(r'''(?msx)
-            \{\{ [\x20\t]*
-            ([^\|]*?) [\x20\t]*
-            (?: \| [\x20\t]* (.*?) [\x20\t]* )?
-            \}\}\Z
-        ''', data)
+        m = BRACED_PATTERN.match(data)
         if not m:
             self.put(data)
             return
         (link, title) = m.groups()
         if title is None:
             title = ''
-        visitor = self.link_visitor;
-        if not visitor:
-            visitor = self
-        image = visitor.visit_image(link, title, self)
+        if self.type == 'text':
+            self.put(title)
+            return
+        image = self.image_attrs.get((link, title))
+        if image is None:
+            visitor = self.link_visitor;
+            if not visitor:
+                visitor = self
+            image = visitor.visit_image(link, title, self)
         if 'src' not in image:
             self.put(data)
             return
@@ -696,10 +1594,15 @@ class Creolize:
         self.put_raw('<img' + attr + ' />')
 
     def _insert_link(self, source, link, text):
-        visitor = self.link_visitor;
-        if not visitor:
-            visitor = self
-        anchor = visitor.visit_link(link, text, self)
+        if self.type == 'text':
+            self.put(text)
+            return
+        anchor = self.link_anchors.get((link, text))
+        if anchor is None:
+            visitor = self.link_visitor;
+            if not visitor:
+                visitor = self
+            anchor = visitor.visit_link(link, text, self)
         if 'name' not in anchor and 'href' not in anchor:
             self.put(source)
             return
@@ -731,12 +1634,20 @@ class Creolize:
             return
         self.plugin_running = True
         try:
-            visitor = self.plugin_visitor;
-            if not visitor:
-                visitor = self
-            plugin = visitor.visit_plugin(source, self)
+            if self.plugin_results is not None:
+                plugin = self.plugin_results.popleft()
+            else:
+                visitor = self.plugin_visitor;
+                if not visitor:
+                    visitor = self
+                plugin = visitor.visit_plugin(source, self)
             if not plugin:
                 pass
+            elif self.type == 'text':
+                for k in ['text', 'xml', 'html']:
+                    if k in plugin:
+                        self.put(plugin[k])
+                        break
             elif 'djangotag' in plugin:
                 t = self.escape_django(plugin['djangotag'])
                 self.put_raw('{% ' + t + ' %}')
@@ -775,3 +1686,276 @@ class Creolize:
         self.put_xml(data.strip(' \r\n'))
         self._put_markup('<<<', 'etag')
 
+def plain_text(s):
+    """ the escape_text and escape_xml of type 'text'. """
+    return s
+
+def string_hash32(data):
+    """ hash() of the byte string data on a 32 bit Python 2 without
+        hash randomization.
+    """
+    data = bytearray(data)
+    if not data:
+        return 0
+    x = data[0] << 7
+    for c in data:
+        x = ((1000003 * x) & 0xffffffff) ^ c
+    x ^= len(data)
+    if x >= 0x80000000:
+        x -= 0x100000000
+    if x == -1:
+        x = -2
+    return x
+
+def convert_many(sources, workers=None, as_completed=False,
+                 chunk_size=262144, **config):
+    """ convert many wiki sources in a pool of worker processes.
+
+    Each worker builds its own Creolize from config, which must be
+    picklable. Sources are sent in chunks of about chunk_size characters.
+    Returns the list of XHTML in the order of sources, or with as_completed
+    an iterator of (index, xhtml) pairs in the order they are finished.
+    """
+    Creolize(**config)
+    chunks = []
+    chunk = []
+    size = 0
+    for (i, source) in enumerate(sources):
+        chunk.append((i, source))
+        size += len(source)
+        if size >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunks.append(chunk)
+    pairs = _convert_chunks(chunks, workers, config)
+    if as_completed:
+        return pairs
+    results = [None] * sum(len(chunk) for chunk in chunks)
+    for (i, xhtml) in pairs:
+        results[i] = xhtml
+    return results
+
+def _convert_chunks(chunks, workers, config):
+    if workers == 1 or len(chunks) <= 1:
+        creo = Creolize(**config)
+        for chunk in chunks:
+            for pair in _render_chunk(creo, chunk):
+                yield pair
+        return
+    pool = multiprocessing.Pool(workers, _init_worker, (config,))
+    try:
+        for pairs in pool.imap_unordered(_convert_chunk, chunks):
+            for pair in pairs:
+                yield pair
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _as_future(value):
+    if asyncio.iscoroutine(value) or hasattr(value, '__await__') \
+            or isinstance(value, asyncio.Future):
+        return asyncio.ensure_future(value)
+    future = asyncio.Future()
+    future.set_result(value)
+    return future
+
+_worker_converter = None
+
+def _init_worker(config):
+    global _worker_converter
+    _worker_converter = Creolize(**config)
+
+def _convert_chunk(chunk):
+    return _render_chunk(_worker_converter, chunk)
+
+def _render_chunk(creo, chunk):
+    return [(i, creo.convert(source).result) for (i, source) in chunk]
+
+STAMP_NAME = '.creolize-stamp'
+
+def main(argv=None):
+    """ python -m creolize [options] [path ...]
+
+    Convert the standard input, single files or directory trees. Outputs
+    newer than their source and the configuration stamp are skipped.
+    """
+    parser = argparse.ArgumentParser(prog='python -m creolize',
+        description='convert WikiCreole text to XHTML')
+    parser.add_argument('paths', nargs='*', metavar='path',
+        help='source files or directories (default: standard input)')
+    parser.add_argument('-o', '--output', metavar='PATH',
+        help='output file, or output directory for a directory tree')
+    parser.add_argument('--type', default='xhtml',
+        choices=['xhtml', 'django', 'text'])
+    parser.add_argument('--toc', type=int, default=0, metavar='N',
+        help='put a table of contents when there are N headings or more')
+    parser.add_argument('--heading-id', default='crc32',
+        choices=['crc32', 'compat'],
+        help='digest of the heading ids (default crc32)')
+    parser.add_argument('--script-name', default='http://example.net/wiki/')
+    parser.add_argument('--static-location',
+        default='http://example.net/static/')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+        help='number of worker processes')
+    parser.add_argument('--suffix', default='.creole',
+        help='suffix of the sources in directories (default .creole)')
+    parser.add_argument('--output-suffix', default='.html',
+        help='suffix of the outputs (default .html)')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('-f', '--force', action='store_true',
+        help='convert even if the output is up to date')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    config = {
+        'type': args.type,
+        'toc': args.toc,
+        'heading_id': args.heading_id,
+        'script_name': args.script_name,
+        'static_location': args.static_location,
+    }
+    if not args.paths or args.paths == ['-']:
+        stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+        stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+        source = stdin.read().decode(args.encoding)
+        result = Creolize(**config).convert(source).result
+        if args.output is None:
+            stdout.write(result.encode(args.encoding))
+            return 0
+        f = io.open(args.output, 'w', encoding=args.encoding)
+        try:
+            f.write(result)
+        finally:
+            f.close()
+        return 0
+    if args.output is not None and len(args.paths) > 1:
+        parser.error('--output needs a single path')
+    jobs = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            jobs.extend(_tree_jobs(path, args.output or path, args))
+        elif os.path.isfile(path):
+            output = args.output
+            if output is None:
+                output = os.path.splitext(path)[0] + args.output_suffix
+            jobs.append((path, output, os.path.dirname(output) or '.'))
+        else:
+            parser.error('no such file or directory: %s' % path)
+    stamps = {}
+    for (path, output, root) in jobs:
+        if root not in stamps:
+            stamps[root] = _update_stamp(root, config)
+    stale = [(path, output) for (path, output, root) in jobs
+        if args.force or not _is_fresh(path, output, stamps[root])]
+    for (path, output) in _convert_files(stale, args.jobs, config,
+                                         args.encoding):
+        if args.verbose:
+            sys.stderr.write('%s -> %s\n' % (path, output))
+    return 0
+
+def _tree_jobs(top, out_top, args):
+    for (dirpath, dirnames, filenames) in os.walk(top):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.endswith(args.suffix):
+                continue
+            path = os.path.join(dirpath, name)
+            output = os.path.join(out_top, os.path.relpath(path, top))
+            output = output[:-len(args.suffix)] + args.output_suffix
+            yield (path, output, out_top)
+
+def _convert_files(files, workers, config, encoding, chunk_size=262144):
+    """ convert the (path, output) files in chunks of about chunk_size
+        bytes, the workers reading and writing the files themselves.
+        Yields the pairs as they are written.
+    """
+    chunks = []
+    chunk = []
+    size = 0
+    for pair in files:
+        chunk.append(pair)
+        size += os.path.getsize(pair[0])
+        if size >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunks.append(chunk)
+    jobs = [(chunk, encoding) for chunk in chunks]
+    if workers == 1 or len(jobs) <= 1:
+        creo = Creolize(**config)
+        for job in jobs:
+            for pair in _write_chunk(creo, job):
+                yield pair
+        return
+    pool = multiprocessing.Pool(workers, _init_worker, (config,))
+    try:
+        for pairs in pool.imap_unordered(_convert_file_chunk, jobs):
+            for pair in pairs:
+                yield pair
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _convert_file_chunk(job):
+    return _write_chunk(_worker_converter, job)
+
+def _write_chunk(creo, job):
+    (chunk, encoding) = job
+    for (path, output) in chunk:
+        f = io.open(path, 'r', encoding=encoding)
+        try:
+            source = f.read()
+        finally:
+            f.close()
+        result = creo.convert(source).result
+        directory = os.path.dirname(output)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        f = io.open(output, 'w', encoding=encoding)
+        try:
+            f.write(result)
+        finally:
+            f.close()
+    return chunk
+
+def _update_stamp(root, config):
+    """ rewrite the configuration stamp in root only when it changes and
+        return its modification time.
+    """
+    stamp = os.path.join(root, STAMP_NAME)
+    text = repr(sorted(config.items())) + '\n'
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    try:
+        f = open(stamp)
+        try:
+            old = f.read()
+        finally:
+            f.close()
+    except (IOError, OSError):
+        old = None
+    if old != text:
+        f = open(stamp, 'w')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+    return os.path.getmtime(stamp)
+
+def _is_fresh(path, output, stamp_mtime):
+    try:
+        mtime = os.path.getmtime(output)
+    except OSError:
+        return False
+    return mtime > os.path.getmtime(path) and mtime > stamp_mtime
+
+if __name__ == '__main__':
+    sys.exit(main())
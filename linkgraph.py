@@ -0,0 +1,175 @@
+"""
+linkgraph.py - link graph of a tree of WikiCreole pages in sqlite3.
+
+    python -m linkgraph [--db links.sqlite] [-j N] [--suffix .creole] top
+    python -m linkgraph [--db links.sqlite] --backlinks PageName
+
+A page is named by its path under top without the suffix. Later runs
+scan again only the pages whose content digest changed, and forget the
+pages that were removed.
+"""
+
+import os
+import sys
+import hashlib
+import sqlite3
+import argparse
+import multiprocessing
+import creolize
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    name TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    description TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_source ON links (source);
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+'''
+
+
+class LinkGraph(object):
+    """ the links of the pages stored in the sqlite3 database path. """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, top, suffix='.creole', workers=None, encoding='utf-8',
+               chunk_size=64):
+        """ scan the pages of top changed since the last update.
+
+        Returns the pair of the numbers of pages scanned and removed.
+        """
+        digests = dict(self.db.execute('SELECT name, digest FROM pages'))
+        chunks = []
+        chunk = []
+        names = set()
+        for (name, path) in walk_pages(top, suffix):
+            names.add(name)
+            chunk.append((name, path, digests.get(name)))
+            if len(chunk) >= chunk_size:
+                chunks.append(chunk)
+                chunk = []
+        if chunk:
+            chunks.append(chunk)
+        removed = [name for name in digests if name not in names]
+        scanned = 0
+        for (name, digest, links) in _scan_chunks(chunks, workers, encoding):
+            self._forget(name)
+            self.db.execute('INSERT INTO pages VALUES (?, ?)', (name, digest))
+            self.db.executemany('INSERT INTO links VALUES (?, ?, ?, ?, ?)',
+                [(name,) + link for link in links])
+            scanned += 1
+        for name in removed:
+            self._forget(name)
+        self.db.commit()
+        return (scanned, len(removed))
+
+    def _forget(self, name):
+        self.db.execute('DELETE FROM pages WHERE name = ?', (name,))
+        self.db.execute('DELETE FROM links WHERE source = ?', (name,))
+
+    def backlinks(self, name):
+        """ the sorted names of the pages linking to the page name. """
+        cursor = self.db.execute('SELECT DISTINCT source FROM links '
+            'WHERE target = ? AND kind = ? ORDER BY source', (name, 'bracketed'))
+        return [row[0] for row in cursor]
+
+    def links(self, name):
+        """ (target, description, kind, offset) of the links of name. """
+        cursor = self.db.execute('SELECT target, description, kind, offset '
+            'FROM links WHERE source = ? ORDER BY offset', (name,))
+        return [tuple(row) for row in cursor]
+
+
+def walk_pages(top, suffix):
+    """ yield (name, path) for the files under top ending with suffix. """
+    for (dirpath, dirnames, filenames) in os.walk(top):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith(suffix):
+                continue
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, top)[:-len(suffix)]
+            yield (name.replace(os.sep, '/'), path)
+
+
+def _scan_chunks(chunks, workers, encoding):
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            for page in _scan_chunk((chunk, encoding)):
+                yield page
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        jobs = [(chunk, encoding) for chunk in chunks]
+        for pages in pool.imap_unordered(_scan_chunk, jobs):
+            for page in pages:
+                yield page
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _scan_chunk(job):
+    """ (name, digest, links) of the pages of the chunk whose digest
+        differs from the stored one.
+    """
+    (chunk, encoding) = job
+    creo = creolize.Creolize()
+    pages = []
+    for (name, path, old_digest) in chunk:
+        f = open(path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        digest = hashlib.sha1(data).hexdigest()
+        if digest != old_digest:
+            links = creo.links(data.decode(encoding))
+            pages.append((name, digest, links))
+    return pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m linkgraph',
+        description='build the link graph of a tree of wiki pages')
+    parser.add_argument('top', nargs='?', help='directory of the pages')
+    parser.add_argument('--db', default='links.sqlite',
+        help='sqlite3 database of the graph (default links.sqlite)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, metavar='N',
+        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--suffix', default='.creole',
+        help='suffix of the pages (default .creole)')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--backlinks', metavar='NAME',
+        help='print the pages linking to NAME')
+    args = parser.parse_args(argv)
+    if args.top is None and args.backlinks is None:
+        parser.error('give a directory or --backlinks')
+    graph = LinkGraph(args.db)
+    try:
+        if args.top is not None:
+            (scanned, removed) = graph.update(args.top, args.suffix,
+                args.jobs, args.encoding)
+            sys.stderr.write('%d scanned, %d removed\n' % (scanned, removed))
+        if args.backlinks is not None:
+            for name in graph.backlinks(args.backlinks):
+                print(name)
+    finally:
+        graph.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,7 +6,7 @@ setup(name='creolize',
       author='MIZUTANI Tociyuki',
       author_email='tociyuki@gmail.com',
       url='https://github.com/tociyuki/python-creolize',
-      py_modules=['creolize'],
+      py_modules=['creolize', 'linkgraph'],
       license='GNU GPLv2',
       )
 
@@ -9,6 +9,26 @@ from tests import test_21_pholder
 from tests import test_22_plugin
 from tests import test_23_toc
 from tests import test_30_django
+from tests import test_40_iter
+from tests import test_41_sink
+from tests import test_42_input
+from tests import test_43_engine
+from tests import test_44_profile
+from tests import test_45_cache
+from tests import test_46_rerender
+from tests import test_47_many
+from tests import test_48_cli
+from tests import test_49_threads
+from tests import test_50_escape
+from tests import test_51_batch
+from tests import test_52_plugin_cache
+from tests import test_53_heading_id
+from tests import test_54_toc_position
+from tests import test_55_outline
+from tests import test_56_links
+from tests import test_57_linkgraph
+from tests import test_58_plaintext
+from tests import test_59_async
 
 def suite():
     suite = unittest.TestSuite()
@@ -21,6 +41,26 @@ def suite():
     suite.addTest(test_22_plugin.TestCreolize('runTest'))
     suite.addTest(test_23_toc.TestCreolize('runTest'))
     suite.addTest(test_30_django.TestCreolize('runTest'))
+    suite.addTest(test_40_iter.TestCreolize('runTest'))
+    suite.addTest(test_41_sink.TestCreolize('runTest'))
+    suite.addTest(test_42_input.TestCreolize('runTest'))
+    suite.addTest(test_43_engine.TestCreolize('runTest'))
+    suite.addTest(test_44_profile.TestCreolize('runTest'))
+    suite.addTest(test_45_cache.TestCreolize('runTest'))
+    suite.addTest(test_46_rerender.TestCreolize('runTest'))
+    suite.addTest(test_47_many.TestCreolize('runTest'))
+    suite.addTest(test_48_cli.TestCreolize('runTest'))
+    suite.addTest(test_49_threads.TestCreolize('runTest'))
+    suite.addTest(test_50_escape.TestCreolize('runTest'))
+    suite.addTest(test_51_batch.TestCreolize('runTest'))
+    suite.addTest(test_52_plugin_cache.TestCreolize('runTest'))
+    suite.addTest(test_53_heading_id.TestCreolize('runTest'))
+    suite.addTest(test_54_toc_position.TestCreolize('runTest'))
+    suite.addTest(test_55_outline.TestCreolize('runTest'))
+    suite.addTest(test_56_links.TestCreolize('runTest'))
+    suite.addTest(test_57_linkgraph.TestCreolize('runTest'))
+    suite.addTest(test_58_plaintext.TestCreolize('runTest'))
+    suite.addTest(test_59_async.TestCreolize('runTest'))
     return suite
 
 if __name__ == '__main__':
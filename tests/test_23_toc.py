@@ -28,6 +28,7 @@ class TestCreolize(unittest.TestCase):
     def runTest(self, block):
         creo = creolize.Creolize()
         creo.toc = 1
+        creo.heading_id = 'compat'
         got = creo.convert(block['input']).result
         self.assertNotDiff(got, block['expected'], block['name'])
 
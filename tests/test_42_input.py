@@ -0,0 +1,182 @@
+import unittest
+import re
+import difflib
+import StringIO
+import time
+import creolize
+
+SPEC = r"""
+.test blank lines inside verbatim
+.sect input
+first
+
+{{{
+code
+
+  more
+}}}
+
+last
+.sect expected
+<p>first</p>
+<pre>code
+
+  more</pre>
+<p>last</p>
+
+.test nowiki across a blank line
+.sect input
+a {{{ nowiki
+
+across }}} b
+
+c
+.sect expected
+<p>a <code>nowiki
+
+across</code> b</p>
+<p>c</p>
+
+.test placeholder across a blank line
+.sect input
+x <<<hold
+
+er>>> y
+
+z
+.sect expected
+<p>x hold
+
+er y</p>
+<p>z</p>
+
+.test lists and tables
+.sect input
+* item
+** nested
+
+|a|b|
+|c|d|
+.sect expected
+<ul>
+<li>item
+<ul>
+<li>nested</li>
+</ul>
+</li>
+</ul>
+<table>
+<tr><td>a</td><td>b</td></tr>
+<tr><td>c</td><td>d</td></tr>
+</table>
+
+.test an unclosed placeholder before many paragraphs
+.sect input
+cout << x;
+.sect repeat
+8000 paragraph
+.sect expected
+<p>cout &lt;&lt; x;</p>
+"""
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        if 'repeat' in block:
+            self.runRepeat(block)
+            return
+        lines = block['input'].splitlines(True)
+        crlf = [line.replace('\n', '\r\n') for line in lines]
+        got = creolize.Creolize().convert(iter(crlf)).result
+        self.assertNotDiff(got, block['expected'], block['name'])
+        stream = StringIO.StringIO(block['input'])
+        got = creolize.Creolize().convert(stream).result
+        self.assertNotDiff(got, block['expected'], block['name'])
+
+    def runRepeat(self, block):
+        (count, text) = block['repeat'].split(' ', 1)
+        lines = [block['input'] + '\n', '\n']
+        for i in range(int(count)):
+            lines.extend(['%s %d\n' % (text, i), '\n'])
+        expected = block['expected'] + '\n' + ''.join(
+            '<p>%s %d</p>\n' % (text, i) for i in range(int(count)))
+        start = time.time()
+        got = creolize.Creolize().convert(''.join(lines)).result
+        whole = time.time() - start
+        self.assertNotDiff(got, expected, block['name'])
+        start = time.time()
+        got = creolize.Creolize().convert(iter(lines)).result
+        streamed = time.time() - start
+        self.assertNotDiff(got, expected, block['name'])
+        # the open placeholder must not make the stream quadratic
+        self.assertTrue(streamed < 4 * whole + 0.2,
+            '%s: streamed %.2fs, whole %.2fs' % (block['name'], streamed, whole))
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException, msg + '\n' + d
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, self._exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()
+
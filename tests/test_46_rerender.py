@@ -0,0 +1,204 @@
+import unittest
+import re
+import difflib
+import creolize
+
+SPEC = r"""
+.test edit one paragraph
+.sect input
+first
+
+second
+
+third
+.sect edited
+first
+
+second, edited
+
+third
+.sect expected
+<p>first</p>
+<p>second, edited</p>
+<p>third</p>
+--
+changed 1 2 replaced 1 2
+
+.test insert a block
+.sect input
+first
+
+third
+.sect edited
+first
+
+* second
+
+third
+.sect expected
+<p>first</p>
+<ul>
+<li>second</li>
+</ul>
+<p>third</p>
+--
+changed 0 2 replaced 0 1
+
+.test delete a block
+.sect input
+first
+
+second
+
+third
+.sect edited
+first
+
+third
+.sect expected
+<p>first</p>
+<p>third</p>
+--
+changed 0 1 replaced 0 2
+
+.test open nowiki swallows the following blocks
+.sect input
+first
+
+second
+
+third }}} end
+.sect edited
+first {{{
+
+second
+
+third }}} end
+.sect expected
+<p>first <code>
+
+second
+
+third</code> end</p>
+--
+changed 0 1 replaced 0 3
+
+.test append to the last block
+.sect input
+first
+
+second
+.sect edited
+first
+
+second
+continued
+.sect expected
+<p>first</p>
+<p>second continued</p>
+--
+changed 1 2 replaced 1 2
+
+.test delete the line break after a heading
+.sect input
+= Title =
+
+#{<< p ug >>}x
+.sect edited
+= Title =<< p ug >>}x
+.sect expected
+<h1>Title =&#125;x</h1>
+--
+changed 0 2 replaced 0 2
+
+.test append directly after a heading
+.sect input
+= Title =
+.sect edited
+= Title =**{{img.png}}
+.sect expected
+<h1>Title =<strong><img src="http://example.net/static/img.png" alt="" /></strong></h1>
+--
+changed 0 2 replaced 0 2
+"""
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        creo = creolize.Creolize()
+        state = creo.rerender(None, block['input'])
+        state = creo.rerender(state, block['edited'])
+        full = creolize.Creolize().convert(block['edited']).result
+        self.assertNotDiff(state.result, full, block['name'])
+        got = state.result + '--\nchanged %d %d replaced %d %d' % (
+            state.changed + state.replaced)
+        self.assertNotDiff(got, block['expected'], block['name'])
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException, msg + '\n' + d
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, self._exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()
+
@@ -0,0 +1,132 @@
+import unittest
+import re
+import difflib
+import creolize
+
+SPEC = r"""
+.test pages come back in input order
+.sect input
+= First
+
+page one
+%
+page [[two]]
+%
+* page
+* three
+%
+Modified << last_modified >>.
+.sect expected
+<h1>First</h1>
+<p>page one</p>
+--
+<p>page {% wiki_link 'two','two' %}</p>
+--
+<ul>
+<li>page</li>
+<li>three</li>
+</ul>
+--
+<p>Modified {% wiki_plugin last_modified %}.</p>
+
+.test interleaved in-process iterators keep their own config
+.sect input
+page [[one]]
+%
+page [[two]]
+.sect expected
+<p>page {% wiki_link 'one','one' %}</p>
+--
+<p>page {% wiki_link 'two','two' %}</p>
+"""
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        pages = block['input'].split('\n%\n')
+        results = creolize.convert_many(pages, workers=2, chunk_size=16,
+            type='django', script_name='')
+        got = '--\n'.join(results)
+        self.assertNotDiff(got, block['expected'], block['name'])
+        pairs = creolize.convert_many(pages, workers=2, chunk_size=16,
+            as_completed=True, type='django', script_name='')
+        got = '--\n'.join(xhtml for (i, xhtml) in sorted(pairs))
+        self.assertNotDiff(got, block['expected'], block['name'])
+        a = creolize.convert_many(pages, workers=1, chunk_size=1,
+            as_completed=True, type='django', script_name='')
+        b = creolize.convert_many(pages, workers=1, chunk_size=1,
+            as_completed=True)
+        pairs = [next(a)]
+        next(b)
+        pairs.extend(a)
+        got = '--\n'.join(xhtml for (i, xhtml) in sorted(pairs))
+        self.assertNotDiff(got, block['expected'], block['name'])
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException, msg + '\n' + d
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, self._exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()
+
@@ -0,0 +1,209 @@
+import unittest
+import re
+import difflib
+import os
+import sys
+import shutil
+import tempfile
+import creolize
+import StringIO
+
+SPEC = r"""
+.test converts a file with options
+.sect options
+--type django --script-name /wiki/
+.sect input
+= Title
+
+See [[FrontPage]].
+.sect expected
+<h1>Title</h1>
+<p>See {% wiki_link 'FrontPage','FrontPage' %}.</p>
+
+.test default options
+.sect options
+.sect input
+See [[FrontPage]] and {{logo.png|Logo}}.
+.sect expected
+<p>See <a href="http://example.net/wiki/FrontPage">FrontPage</a> and <img src="http://example.net/static/logo.png" alt="Logo" />.</p>
+
+.test standard input to an output file
+.sect options
+-
+.sect stdin
+.sect input
+See [[FrontPage]].
+.sect expected
+<p>See <a href="http://example.net/wiki/FrontPage">FrontPage</a>.</p>
+
+.test a tree is converted again only when stale
+.sect tree
+-- FrontPage.creole
+= Front
+
+See [[sub/Notes]].
+-- sub/Notes.creole
+= Notes
+-- sub/More.creole
+More notes.
+.sect runs
+-j 2
+-j 2
+-j 2 --toc 1
+.sect expected
+run -j 2
+FrontPage.creole -> html/FrontPage.html
+sub/More.creole -> html/sub/More.html
+sub/Notes.creole -> html/sub/Notes.html
+run -j 2
+run -j 2 --toc 1
+FrontPage.creole -> html/FrontPage.html
+sub/More.creole -> html/sub/More.html
+sub/Notes.creole -> html/sub/Notes.html
+-- html/FrontPage.html
+<div class="toc">
+<ul>
+<li><a href="#h0hjkbg2">Front</a></li>
+</ul>
+</div>
+<h1 id="h0hjkbg2">Front</h1>
+<p>See <a href="http://example.net/wiki/sub/Notes">sub/Notes</a>.</p>
+"""
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        if 'tree' in block:
+            self.runTree(block)
+            return
+        tmpdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmpdir, 'page.creole')
+            output = os.path.join(tmpdir, 'page.html')
+            f = open(source, 'w')
+            f.write(block['input'] + '\n')
+            f.close()
+            argv = block.get('options', '').split() + ['-o', output]
+            if 'stdin' in block:
+                stdin = sys.stdin
+                sys.stdin = open(source, 'rb')
+                try:
+                    creolize.main(argv)
+                finally:
+                    sys.stdin.close()
+                    sys.stdin = stdin
+            else:
+                creolize.main(argv + [source])
+            f = open(output)
+            got = f.read()
+            f.close()
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertNotDiff(got, block['expected'] + '\n', block['name'])
+
+    def runTree(self, block):
+        tmpdir = tempfile.mkdtemp()
+        stderr = sys.stderr
+        try:
+            top = os.path.join(tmpdir, 'pages')
+            out_top = os.path.join(tmpdir, 'html')
+            for page in block['tree'].split('-- ')[1:]:
+                (name, text) = page.split('\n', 1)
+                path = os.path.join(top, name)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                f = open(path, 'w')
+                f.write(text)
+                f.close()
+            got = ''
+            for options in block['runs'].splitlines():
+                # outputs must be newer than the sources and the stamp
+                for (dirpath, dirnames, filenames) in os.walk(tmpdir):
+                    for name in filenames:
+                        if not name.endswith('.html'):
+                            path = os.path.join(dirpath, name)
+                            mtime = os.path.getmtime(path) - 10
+                            os.utime(path, (mtime, mtime))
+                sys.stderr = StringIO.StringIO()
+                creolize.main(options.split() + ['-v', top, '-o', out_top])
+                lines = sys.stderr.getvalue().replace(top + os.sep, '')
+                lines = lines.replace(tmpdir + os.sep, '').splitlines()
+                sys.stderr = stderr
+                got += 'run %s\n' % options
+                got += ''.join(line + '\n' for line in sorted(lines))
+            f = open(os.path.join(out_top, 'FrontPage.html'))
+            got += '-- html/FrontPage.html\n' + f.read()
+            f.close()
+        finally:
+            sys.stderr = stderr
+            shutil.rmtree(tmpdir)
+        self.assertNotDiff(got, block['expected'] + '\n', block['name'])
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException, msg + '\n' + d
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, self._exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()
+
@@ -0,0 +1,127 @@
+import unittest
+import re
+import difflib
+import creolize
+
+SPEC = r"""
+.test one call for all links and images
+.sect input
+See [[FrontPage]], [[Missing|a missing page]] and http://example.com/.
+
+Again [[FrontPage]] with {{logo.png|Logo}}.
+.sect expected
+<p>See <a href="/wiki/FrontPage">FrontPage</a>, <a href="/wiki/Missing" title="missing">a missing page</a> and <a href="http://example.com/">http://example.com/</a>.</p>
+<p>Again <a href="/wiki/FrontPage">FrontPage</a> with <img src="/static/logo.png" alt="Logo" />.</p>
+--
+visit_links FrontPage|Missing|http://example.com/
+visit_images logo.png
+"""
+
+class MockBatchVisitor:
+    def __init__(self):
+        self.calls = []
+
+    def visit_links(self, links, builder):
+        self.calls.append('visit_links ' + '|'.join(l[0] for l in links))
+        anchors = []
+        for (link, text) in links:
+            anchor = {'text': text}
+            if link.startswith('http:'):
+                anchor['href'] = link
+            else:
+                anchor['href'] = '/wiki/' + link
+            if link == 'Missing':
+                anchor['title'] = 'missing'
+            anchors.append(anchor)
+        return anchors
+
+    def visit_link(self, link, text, builder):
+        self.calls.append('visit_link ' + link)
+        return {'href': link, 'text': text}
+
+    def visit_images(self, images, builder):
+        self.calls.append('visit_images ' + '|'.join(i[0] for i in images))
+        return [{'src': '/static/' + link, 'alt': title}
+            for (link, title) in images]
+
+    def visit_image(self, link, title, builder):
+        self.calls.append('visit_image ' + link)
+        return {'src': link, 'alt': title}
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        creo = creolize.Creolize()
+        creo.link_visitor = MockBatchVisitor()
+        got = creo.convert(block['input']).result
+        got += '--\n' + '\n'.join(creo.link_visitor.calls)
+        self.assertNotDiff(got, block['expected'], block['name'])
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException, msg + '\n' + d
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, self._exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()
+
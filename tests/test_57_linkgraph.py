@@ -0,0 +1,159 @@
+import unittest
+import re
+import difflib
+import os
+import shutil
+import tempfile
+import creolize
+import linkgraph
+
+SPEC = r"""
+.test backlinks of a small wiki
+.sect input
+-- FrontPage
+See [[Help]], [[sub/Notes|notes]] and http://example.com/.
+-- Help
+Back to [[FrontPage]]. Not ~[[Notes]], {{{[[Nowiki]]}}}.
+-- sub/Notes
+[[FrontPage]] [[Help]] {{Help}}
+.sect expected
+scanned 3 removed 0
+FrontPage <- Help sub/Notes
+Help <- FrontPage sub/Notes
+sub/Notes <- FrontPage
+scanned 0 removed 0
+.sect modified
+-- Help
+Only [[sub/Notes]] now.
+.sect deleted
+sub/Notes
+.sect expected after changes
+scanned 1 removed 0
+FrontPage <- sub/Notes
+Help <- FrontPage sub/Notes
+sub/Notes <- FrontPage Help
+scanned 0 removed 1
+FrontPage <-
+Help <- FrontPage
+sub/Notes <- FrontPage Help
+"""
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            top = os.path.join(tmpdir, 'wiki')
+            names = self.write_pages(top, block['input'])
+            graph = linkgraph.LinkGraph(os.path.join(tmpdir, 'links.sqlite'))
+            lines = ['scanned %d removed %d' % graph.update(top, workers=1)]
+            for name in names:
+                lines.append(name + ' <- ' + ' '.join(graph.backlinks(name)))
+            lines.append('scanned %d removed %d' % graph.update(top, workers=1))
+            got = '\n'.join(lines)
+            lines = []
+            if 'modified' in block:
+                self.write_pages(top, block['modified'])
+                lines.append('scanned %d removed %d' % graph.update(top,
+                    workers=1))
+                for name in names:
+                    lines.append(name + ' <- '
+                        + ' '.join(graph.backlinks(name)))
+            if 'deleted' in block:
+                for name in block['deleted'].split():
+                    os.remove(os.path.join(top, name + '.creole'))
+                lines.append('scanned %d removed %d' % graph.update(top,
+                    workers=1))
+                for name in names:
+                    lines.append(name + ' <- '
+                        + ' '.join(graph.backlinks(name)))
+            graph.close()
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertNotDiff(got, block['expected'], block['name'])
+        if lines:
+            got = '\n'.join(line.rstrip() for line in lines)
+            self.assertNotDiff(got, block['expected after changes'],
+                block['name'])
+
+    def write_pages(self, top, pages):
+        names = []
+        for page in pages.split('-- ')[1:]:
+            (name, body) = page.split('\n', 1)
+            names.append(name)
+            path = os.path.join(top, name + '.creole')
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            f = open(path, 'w')
+            f.write(body)
+            f.close()
+        return names
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException, msg + '\n' + d
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, self._exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()
+
@@ -0,0 +1,149 @@
+import unittest
+import re
+import difflib
+import creolize
+
+SPEC = r"""
+.test paragraphs links and escapes
+.sect input
+= Title & <more>
+
+A **bold** [[Link|description]], http://example.com/ and {{logo.png|Logo}}.
+Not ~[[escaped]] but {{{ <nowiki> }}}.
+.sect expected
+Title & <more>
+A bold description, http://example.com/ and Logo. Not [[escaped]] but <nowiki>.
+
+.test lists tables and verbatim
+.sect input
+* one
+* two
+
+|= name |= value |
+| a | 1 |
+
+{{{
+if a < b:
+    pass
+}}}
+.sect expected
+one
+two
+name	value
+a	1
+if a < b:
+    pass
+
+.test nested lists end with one newline
+.sect input
+* one
+** two
+*** three
+* four
+# five
+## six
+
+after
+.sect expected
+one
+two
+three
+four
+five
+six
+after
+"""
+
+class MockBatchVisitor:
+    def __init__(self):
+        self.calls = []
+
+    def visit_links(self, links, builder):
+        self.calls.append('visit_links')
+        return [{'href': link, 'text': text} for (link, text) in links]
+
+    def visit_images(self, images, builder):
+        self.calls.append('visit_images')
+        return [{'src': link, 'alt': title} for (link, title) in images]
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        creo = creolize.Creolize()
+        creo.link_visitor = MockBatchVisitor()
+        got = creo.plaintext(block['input'])
+        self.assertNotDiff(got, block['expected'] + '\n', block['name'])
+        creo.type = 'text'
+        stream = iter(block['input'].splitlines(True))
+        got = ''.join(creo.convert_iter(stream))
+        self.assertNotDiff(got, block['expected'] + '\n', block['name'])
+        self.assertEqual(creo.link_visitor.calls, [])
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException, msg + '\n' + d
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, self._exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, self._exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()
+
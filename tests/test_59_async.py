@@ -0,0 +1,177 @@
+import sys
+import unittest
+import re
+import difflib
+import creolize
+
+asyncio = creolize.asyncio
+
+SPEC = r"""
+.test plugins run concurrently and render in source order
+.sect input
+= << wait 3 first >>
+
+<< wait 2 second >> and << wait 1 third >>.
+.sect expected
+<h1>first</h1>
+<p>second and third.</p>
+--
+call wait 3 first
+call wait 2 second
+call wait 1 third
+done third after 3 calls
+done second after 3 calls
+done first after 3 calls
+
+.test an included page does not run its plugins
+.sect input
+<< include Other >> << wait 1 outer >>
+.sect expected
+<p><em>inner</em> outer</p>
+--
+call include Other
+call wait 1 outer
+done outer after 2 calls
+
+.test a page included with convert_async does not run its plugins
+.sect input
+<< include_async Other >> << wait 1 outer >>
+.sect expected
+<p><em>inner</em> outer</p>
+--
+call include_async Other
+call wait 1 outer
+done outer after 2 calls
+"""
+
+class MockAsyncPlugin:
+    def __init__(self, loop):
+        self.loop = loop
+        self.calls = []
+
+    def visit_plugin(self, data, builder):
+        self.calls.append('call ' + data.strip())
+        words = data.split()
+        if words[0] == 'include':
+            inner = builder.convert('//inner << wait 1 nested >>//').result
+            return {'content': inner[len('<p>'):-len('</p>\n')]}
+        if words[0] == 'include_async':
+            return self.include_async(builder)
+        future = self.loop.create_future()
+        self.loop.call_later(int(words[1]) * 0.01, self.finish, future,
+            words[2])
+        return future
+
+    def include_async(self, builder):
+        inner = builder.convert_async('//inner << wait 1 nested >>//')
+        future = self.loop.create_future()
+
+        def done(inner):
+            if inner.exception() is not None:
+                future.set_exception(inner.exception())
+                return
+            result = inner.result().result
+            future.set_result({'content': result[len('<p>'):-len('</p>\n')]})
+
+        inner.add_done_callback(done)
+        return future
+
+    def finish(self, future, text):
+        count = len([c for c in self.calls if c.startswith('call ')])
+        self.calls.append('done %s after %d calls' % (text, count))
+        future.set_result({'text': text})
+
+class TestCreolize(unittest.TestCase):
+    spec = SPEC
+
+    def runTest(self, block):
+        loop = asyncio.new_event_loop()
+        try:
+            creo = creolize.Creolize()
+            creo.plugin_visitor = MockAsyncPlugin(loop)
+            started = loop.create_future()
+
+            def start():
+                # convert_async needs the running loop
+                try:
+                    started.set_result(creo.convert_async(block['input']))
+                except Exception as e:
+                    started.set_exception(e)
+
+            loop.call_soon(start)
+            future = loop.run_until_complete(started)
+            got = loop.run_until_complete(future).result
+        finally:
+            loop.close()
+        got += '--\n' + '\n'.join(creo.plugin_visitor.calls)
+        self.assertNotDiff(got, block['expected'], block['name'])
+
+    def assertNotDiff(self, first, second, msg=None):
+        if first == second:
+            return
+        a = [line + '\n' for line in first.splitlines()]
+        b = [line + '\n' for line in second.splitlines()]
+        d = ''.join(difflib.unified_diff(a, b, fromfile='first', tofile='second'))
+        if d != '':
+            if msg is None:
+                msg = 'got != expected'
+            raise self.failureException(msg + '\n' + d)
+
+    def _run_block(self, block, result):
+        result.startTest(self)
+        testMethod = getattr(self, self._testMethodName)
+        try:
+            if asyncio is None:
+                result.addSkip(self, 'convert_async needs asyncio')
+                return
+            try:
+                self.setUp()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, sys.exc_info())
+                return
+
+            ok = False
+            try:
+                testMethod(block)
+                ok = True
+            except self.failureException:
+                result.addFailure(self, sys.exc_info())
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, sys.exc_info())
+
+            try:
+                self.tearDown()
+            except KeyboardInterrupt:
+                raise
+            except:
+                result.addError(self, sys.exc_info())
+                ok = False
+            if ok: result.addSuccess(self)
+        finally:
+            result.stopTest(self)
+
+    def run(self, result=None):
+        if result is None: result = self.defaultTestResult()
+        re_block = re.compile(r'''
+            ^\.test[\t\x20]+(.+?)\n(.*?)(?=^\.test|\Z)
+        ''', re.M|re.S|re.X)
+        re_part = re.compile(r'''
+            ^\.sect[\t\x20]+(.+?)\n(.*?)(?=^\.test|^\.sect|\Z)
+        ''', re.M|re.S|re.X)
+        for m_block in re_block.finditer(self.spec):
+            block = {}
+            block['name'] = m_block.group(1).rstrip(' ')
+            block_body = m_block.group(2)
+            for m_part in re_part.finditer(block_body):
+                part_name = m_part.group(1).rstrip(' ')
+                part_body = m_part.group(2).rstrip('\r\n ')
+                block[part_name] = part_body
+            self._testMethodDoc = block['name']
+            self._run_block(block, result)
+
+if __name__ == '__main__':
+    unittest.main()